@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Approximate Mode Benchmark
+--------------------------
+Runs the detector pipeline in exact and approximate mode over the same
+records and compares the alerts, run time and peak memory of each mode.
+Records come from a PCAP file (via PCAPProcessor) or from a synthetic
+traffic generator.
+"""
+
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import yaml
+
+from lib.detectors import DetectorPipeline
+
+
+def load_config(config_path):
+    """Load configuration from YAML file"""
+    try:
+        with open(config_path, 'r') as file:
+            return yaml.safe_load(file)
+    except Exception as e:
+        print(f"Failed to load configuration: {e}")
+        sys.exit(1)
+
+def generate_records(flows, seed=42):
+    """Generate synthetic connection and DNS records with a few planted attacks"""
+    rng = random.Random(seed)
+    conn_data = []
+    dns_data = []
+    start = 1700000000.0
+
+    for i in range(flows):
+        timestamp = start + i * 0.001
+        conn_data.append({
+            'timestamp': timestamp,
+            'src_ip': f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+            'dst_ip': f"172.16.{rng.randrange(64)}.{rng.randrange(256)}",
+            'src_port': rng.randrange(1024, 65536),
+            'dst_port': rng.choice((53, 80, 443, 8080)),
+            'protocol': 'TCP'
+        })
+        if i % 10 == 0:
+            dns_data.append({
+                'timestamp': timestamp,
+                'src_ip': f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                'dst_ip': "8.8.8.8",
+                'query': f"www{rng.randrange(50)}.example{rng.randrange(1000)}.com"
+            })
+
+    # Planted port scans: each scanner sweeps 200 ports on one target
+    for scanner in range(20):
+        for port in range(1, 201):
+            conn_data.append({
+                'timestamp': start + scanner + port * 0.01,
+                'src_ip': f"192.168.100.{scanner}",
+                'dst_ip': f"172.16.0.{scanner}",
+                'src_port': 40000 + port,
+                'dst_port': port,
+                'protocol': 'TCP'
+            })
+
+    # Planted DNS tunnels: many unique subdomains at a high query rate
+    for tunnel in range(5):
+        for n in range(300):
+            dns_data.append({
+                'timestamp': start + tunnel + n * 0.05,
+                'src_ip': f"192.168.200.{tunnel}",
+                'dst_ip': "8.8.8.8",
+                'query': f"{rng.getrandbits(64):016x}.tunnel{tunnel}.net"
+            })
+
+    conn_data.sort(key=lambda record: record['timestamp'])
+    dns_data.sort(key=lambda record: record['timestamp'])
+    return conn_data, dns_data
+
+def run_mode(config, conn_data, dns_data, approximate):
+    """Run the pipeline once and return (alerts, seconds, peak bytes)"""
+    config = copy.deepcopy(config)
+    config['detection'].setdefault('approximate', {})['enabled'] = approximate
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    pipeline = DetectorPipeline(config)
+    alerts = pipeline.run({"conn": conn_data, "dns": dns_data})
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return alerts, duration, peak
+
+def alert_keys(alerts):
+    return {(alert['alert_type'], alert['src_ip'], alert['dst_ip']) for alert in alerts}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exact and approximate detection modes")
+    parser.add_argument("--pcap", help="PCAP file to take records from (default: synthetic traffic)")
+    parser.add_argument("--flows", type=int, default=200000,
+                        help="Number of synthetic background flows (default: 200000)")
+    parser.add_argument("--config", default="config/config.yaml",
+                        help="Path to configuration file (default: config/config.yaml)")
+    parser.add_argument("--output", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if not config['detection'].get('pipeline'):
+        print("Error: detection.pipeline must be configured to run the benchmark")
+        sys.exit(1)
+
+    if args.pcap:
+        from lib.pcap_processor import PCAPProcessor
+        conn_data, dns_data = PCAPProcessor(config).process_pcap(args.pcap)
+        source = args.pcap
+    else:
+        conn_data, dns_data = generate_records(args.flows)
+        source = f"synthetic ({args.flows} flows)"
+
+    print(f"Records: {len(conn_data)} connections, {len(dns_data)} DNS queries from {source}")
+
+    exact_alerts, exact_time, exact_peak = run_mode(config, conn_data, dns_data, False)
+    approx_alerts, approx_time, approx_peak = run_mode(config, conn_data, dns_data, True)
+
+    exact_keys = alert_keys(exact_alerts)
+    approx_keys = alert_keys(approx_alerts)
+    matched = exact_keys & approx_keys
+    recall = len(matched) / len(exact_keys) if exact_keys else 1.0
+    precision = len(matched) / len(approx_keys) if approx_keys else 1.0
+
+    results = {
+        "source": source,
+        "connections": len(conn_data),
+        "dns_queries": len(dns_data),
+        "exact": {"alerts": len(exact_alerts), "seconds": round(exact_time, 3), "peak_bytes": exact_peak},
+        "approximate": {"alerts": len(approx_alerts), "seconds": round(approx_time, 3), "peak_bytes": approx_peak},
+        "recall": round(recall, 4),
+        "precision": round(precision, 4),
+        "missed": sorted(map(list, exact_keys - approx_keys)),
+        "extra": sorted(map(list, approx_keys - exact_keys))
+    }
+
+    print(f"{'mode':<12}{'alerts':>8}{'seconds':>10}{'peak MB':>10}")
+    for mode in ("exact", "approximate"):
+        r = results[mode]
+        print(f"{mode:<12}{r['alerts']:>8}{r['seconds']:>10.3f}{r['peak_bytes'] / 1048576:>10.2f}")
+    print(f"Alert recall vs exact: {recall:.2%}, precision: {precision:.2%}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+"""
+Capture Index
+-------------
+Memory-mapped PCAP/PCAPNG reader that records where every packet lives in the
+capture file, so the packets supporting an alert can be cut back out of the
+original upload without re-reading the whole capture.
+"""
+
+import array
+import bisect
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Classic PCAP magic numbers (microsecond and nanosecond resolution)
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+
+# PCAPNG block types
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1A2B3C4D
+
+# Link types we know how to pull IP addresses out of
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+INDEX_MAGIC = b"PKTIDX01"
+INDEX_HEADER = struct.Struct("<8sIQ")
+
+
+class CaptureFormatError(Exception):
+    """Raised when a file is not a readable PCAP/PCAPNG capture"""
+
+
+class PacketIndex:
+    """Compact per-packet index: file offset and timestamp of every packet"""
+
+    def __init__(self, offsets=None, timestamps=None, linktype=LINKTYPE_ETHERNET):
+        self.offsets = offsets if offsets is not None else array.array("Q")
+        self.timestamps = timestamps if timestamps is not None else array.array("d")
+        self.linktype = linktype
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, offset, timestamp):
+        self.offsets.append(offset)
+        self.timestamps.append(timestamp)
+
+    def sort(self):
+        """Order packets by timestamp.
+
+        Multi-interface PCAPNG captures interleave blocks whose timestamps
+        are not monotonic, so the index is sorted once after it is built and
+        packet numbers always follow capture time.
+        """
+        timestamps = self.timestamps
+        if all(a <= b for a, b in zip(timestamps, timestamps[1:])):
+            return
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        self.offsets = array.array("Q", (self.offsets[i] for i in order))
+        self.timestamps = array.array("d", (timestamps[i] for i in order))
+
+    def save(self, path):
+        """Write the index to a small binary file next to the scan results"""
+        with open(path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.linktype, len(self)))
+            offsets = array.array("Q", self.offsets)
+            timestamps = array.array("d", self.timestamps)
+            if struct.pack("=H", 1) != struct.pack("<H", 1):
+                offsets.byteswap()
+                timestamps.byteswap()
+            offsets.tofile(f)
+            timestamps.tofile(f)
+
+
+def load_offsets(path, ranges):
+    """Read only the file offsets of the packets in ranges from a saved index.
+
+    The index file is memory-mapped, so the cost depends on the number of
+    packets requested rather than on the size of the capture. Returns
+    (linktype, offsets).
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < INDEX_HEADER.size:
+                raise CaptureFormatError(f"Truncated packet index: {path}")
+            magic, linktype, count = INDEX_HEADER.unpack_from(mapped, 0)
+            if magic != INDEX_MAGIC:
+                raise CaptureFormatError(f"Not a packet index file: {path}")
+
+            offsets = array.array("Q")
+            for first, last in ranges:
+                first, last = max(first, 0), min(last, count - 1)
+                if first > last:
+                    continue
+                start = INDEX_HEADER.size + first * 8
+                offsets.frombytes(mapped[start:start + (last - first + 1) * 8])
+
+    if struct.pack("=H", 1) != struct.pack("<H", 1):
+        offsets.byteswap()
+    return linktype, offsets
+
+
+class CaptureReader:
+    """Zero-copy reader over a memory-mapped PCAP or PCAPNG file.
+
+    Packet payloads are returned as memoryview slices of the mapping, so
+    nothing is copied until a caller explicitly asks for bytes.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size == 0:
+                raise CaptureFormatError(f"Capture file is empty: {self.path}")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._mmap)
+        self._detect_format()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Release the mapping and the underlying file handle"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Callers still hold packet views; the mapping is freed with them
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def _detect_format(self):
+        """Work out whether this is classic PCAP or PCAPNG, and its byte order"""
+        if len(self._mmap) < 24:
+            raise CaptureFormatError(f"File too small to be a capture: {self.path}")
+
+        magic_le = struct.unpack_from("<I", self._mmap, 0)[0]
+        magic_be = struct.unpack_from(">I", self._mmap, 0)[0]
+
+        if magic_le in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.format = "pcap"
+            self._endian = "<"
+        elif magic_be in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.format = "pcap"
+            self._endian = ">"
+        elif magic_le == PCAPNG_SHB:
+            self.format = "pcapng"
+            self._endian = self._pcapng_endian(0)
+        else:
+            raise CaptureFormatError(f"Unrecognised capture format: {self.path}")
+
+        if self.format == "pcap":
+            magic, _, _, _, _, snaplen, network = struct.unpack_from(
+                self._endian + "IHHiIII", self._mmap, 0)
+            self._nsec = magic == PCAP_MAGIC_NSEC
+            self.snaplen = snaplen
+            # Upper bits of the network field may carry FCS information
+            self.linktype = network & 0xFFFF
+        else:
+            self.snaplen = 262144
+            self.linktype = None
+
+    def _pcapng_endian(self, offset):
+        bom = struct.unpack_from("<I", self._mmap, offset + 8)[0]
+        if bom == PCAPNG_BOM:
+            return "<"
+        if struct.unpack_from(">I", self._mmap, offset + 8)[0] == PCAPNG_BOM:
+            return ">"
+        raise CaptureFormatError(f"Invalid PCAPNG byte-order magic at offset {offset}")
+
+    def iter_packets(self):
+        """Yield (offset, timestamp, linktype, data) for every packet in the file"""
+        if self.format == "pcap":
+            yield from self._iter_pcap()
+        else:
+            yield from self._iter_pcapng()
+
+    def _iter_pcap(self):
+        record = struct.Struct(self._endian + "IIII")
+        divisor = 1e9 if self._nsec else 1e6
+        size = len(self._mmap)
+        offset = 24
+
+        while offset + record.size <= size:
+            ts_sec, ts_frac, incl_len, _ = record.unpack_from(self._mmap, offset)
+            start = offset + record.size
+            if start + incl_len > size:
+                logger.warning(f"Truncated packet at offset {offset} in {self.path}")
+                break
+            yield offset, ts_sec + ts_frac / divisor, self.linktype, self._view[start:start + incl_len]
+            offset = start + incl_len
+
+    def _iter_pcapng(self):
+        size = len(self._mmap)
+        offset = 0
+        endian = "<"
+        interfaces = []
+        last_ts = 0.0
+
+        while offset + 12 <= size:
+            block_type = struct.unpack_from(endian + "I", self._mmap, offset)[0]
+            if block_type == PCAPNG_SHB:
+                endian = self._pcapng_endian(offset)
+                interfaces = []
+            block_len = struct.unpack_from(endian + "I", self._mmap, offset + 4)[0]
+            if block_len < 12 or offset + block_len > size:
+                logger.warning(f"Truncated PCAPNG block at offset {offset} in {self.path}")
+                break
+
+            if block_type == PCAPNG_IDB:
+                interfaces.append(self._parse_idb(offset, block_len, endian))
+                if self.linktype is None:
+                    self.linktype = interfaces[-1]["linktype"]
+            elif block_type in (PCAPNG_EPB, PCAPNG_OPB, PCAPNG_SPB):
+                packet = self._parse_pcapng_packet(offset, block_type, endian, interfaces, last_ts)
+                if packet is not None:
+                    last_ts = packet[0]
+                    yield (offset,) + packet
+
+            offset += block_len
+
+    def _parse_idb(self, offset, block_len, endian):
+        linktype, _, snaplen = struct.unpack_from(endian + "HHI", self._mmap, offset + 8)
+        units = 1000000
+        ts_offset = 0
+        end = offset + block_len - 4
+        opt = offset + 16
+
+        # Walk the options for if_tsresol (9) and if_tsoffset (14)
+        while opt + 4 <= end:
+            code, length = struct.unpack_from(endian + "HH", self._mmap, opt)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = self._mmap[opt + 4]
+                units = 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+            elif code == 14 and length >= 8:
+                ts_offset = struct.unpack_from(endian + "q", self._mmap, opt + 4)[0]
+            opt += 4 + ((length + 3) & ~3)
+
+        return {"linktype": linktype, "snaplen": snaplen, "units": units, "ts_offset": ts_offset}
+
+    def _parse_pcapng_packet(self, offset, block_type, endian, interfaces, last_ts):
+        if block_type == PCAPNG_EPB:
+            iface_id, ts_high, ts_low, caplen, _ = struct.unpack_from(
+                endian + "IIIII", self._mmap, offset + 8)
+            start = offset + 28
+        elif block_type == PCAPNG_OPB:
+            iface_id, _, ts_high, ts_low, caplen, _ = struct.unpack_from(
+                endian + "HHIIII", self._mmap, offset + 8)
+            start = offset + 28
+        else:
+            # Simple packet blocks carry no timestamp and always use interface 0
+            orig_len = struct.unpack_from(endian + "I", self._mmap, offset + 8)[0]
+            block_len = struct.unpack_from(endian + "I", self._mmap, offset + 4)[0]
+            if not interfaces:
+                return None
+            caplen = min(orig_len, block_len - 16)
+            if interfaces[0]["snaplen"]:
+                caplen = min(caplen, interfaces[0]["snaplen"])
+            start = offset + 12
+            return last_ts, interfaces[0]["linktype"], self._view[start:start + caplen]
+
+        if iface_id >= len(interfaces):
+            logger.warning(f"Packet at offset {offset} references unknown interface {iface_id}")
+            return None
+
+        iface = interfaces[iface_id]
+        ticks = (ts_high << 32) | ts_low
+        timestamp = iface["ts_offset"] + ticks / iface["units"]
+        return timestamp, iface["linktype"], self._view[start:start + caplen]
+
+    def build_index(self):
+        """Walk the capture once and return its PacketIndex"""
+        index = PacketIndex()
+        for offset, timestamp, _, _ in self.iter_packets():
+            index.append(offset, timestamp)
+        index.linktype = self.linktype if self.linktype is not None else LINKTYPE_ETHERNET
+        index.sort()
+        return index
+
+    def packet_at(self, offset):
+        """Return (timestamp, linktype, data) for the packet stored at offset"""
+        if self.format == "pcap":
+            ts_sec, ts_frac, incl_len, _ = struct.unpack_from(self._endian + "IIII", self._mmap, offset)
+            divisor = 1e9 if self._nsec else 1e6
+            start = offset + 16
+            return ts_sec + ts_frac / divisor, self.linktype, self._view[start:start + incl_len]
+
+        # PCAPNG packets need the interface table of their section, so re-walk
+        # the (small) header blocks once and cache them.
+        if not hasattr(self, "_interfaces"):
+            self._interfaces = self._collect_interfaces()
+        section_start = max(s for s in self._interfaces if s <= offset)
+        endian, interfaces = self._interfaces[section_start]
+        block_type = struct.unpack_from(endian + "I", self._mmap, offset)[0]
+        packet = self._parse_pcapng_packet(offset, block_type, endian, interfaces, 0.0)
+        if packet is None:
+            raise CaptureFormatError(f"No packet at offset {offset} in {self.path}")
+        return packet
+
+    def _collect_interfaces(self):
+        """Map each PCAPNG section start offset to (endian, interfaces)"""
+        sections = {}
+        size = len(self._mmap)
+        offset = 0
+        endian = "<"
+        current = None
+
+        while offset + 12 <= size:
+            block_type = struct.unpack_from(endian + "I", self._mmap, offset)[0]
+            if block_type == PCAPNG_SHB:
+                endian = self._pcapng_endian(offset)
+                current = []
+                sections[offset] = (endian, current)
+            block_len = struct.unpack_from(endian + "I", self._mmap, offset + 4)[0]
+            if block_len < 12 or offset + block_len > size:
+                break
+            if block_type == PCAPNG_IDB and current is not None:
+                current.append(self._parse_idb(offset, block_len, endian))
+            offset += block_len
+
+        return sections
+
+    def write_pcap(self, offsets, linktype, out):
+        """Write the packets stored at offsets to out as a classic PCAP stream.
+
+        offsets usually comes from load_offsets() for an alert's packet
+        ranges. Returns the number of packets written.
+        """
+        count = 0
+        if self.format == "pcap":
+            # Same format on both sides: copy the header and raw records as-is
+            out.write(self._view[:24])
+            for offset in offsets:
+                incl_len = struct.unpack_from(self._endian + "I", self._mmap, offset + 8)[0]
+                out.write(self._view[offset:offset + 16 + incl_len])
+                count += 1
+            return count
+
+        # PCAPNG: re-encode as nanosecond PCAP using the index's link type
+        out.write(struct.pack("<IHHiIII", PCAP_MAGIC_NSEC, 2, 4, 0, 0, self.snaplen, linktype))
+        skipped = 0
+        for offset in offsets:
+            timestamp, packet_linktype, data = self.packet_at(offset)
+            if packet_linktype != linktype:
+                skipped += 1
+                continue
+            ts_sec = int(timestamp)
+            ts_nsec = min(int(round((timestamp - ts_sec) * 1e9)), 999999999)
+            out.write(struct.pack("<IIII", ts_sec, ts_nsec, len(data), len(data)))
+            out.write(data)
+            count += 1
+        if skipped:
+            logger.warning(f"Skipped {skipped} packets with a different link type than {linktype}")
+        return count
+
+
+def packet_addresses(linktype, data):
+    """Return the raw (src, dst) address bytes of an IPv4/IPv6 packet, or None"""
+    ip_start = None
+    version = None
+
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = struct.unpack_from(">H", data, 12)[0]
+        pos = 14
+        # Skip 802.1Q / 802.1ad VLAN tags
+        while ethertype in (0x8100, 0x88A8) and len(data) >= pos + 4:
+            ethertype = struct.unpack_from(">H", data, pos + 2)[0]
+            pos += 4
+        if ethertype == 0x0800:
+            ip_start, version = pos, 4
+        elif ethertype == 0x86DD:
+            ip_start, version = pos, 6
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16:
+            return None
+        protocol = struct.unpack_from(">H", data, 14)[0]
+        ip_start, version = 16, {0x0800: 4, 0x86DD: 6}.get(protocol)
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20:
+            return None
+        protocol = struct.unpack_from(">H", data, 0)[0]
+        ip_start, version = 20, {0x0800: 4, 0x86DD: 6}.get(protocol)
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(data) < 4:
+            return None
+        family = struct.unpack_from("<I", data, 0)[0]
+        if family > 0xFFFF:
+            family = struct.unpack_from(">I", data, 0)[0]
+        ip_start, version = 4, 4 if family == 2 else 6 if family in (10, 24, 28, 30) else None
+    elif linktype in (LINKTYPE_RAW, 12, 14, 228, 229):
+        if len(data) < 1:
+            return None
+        ip_start, version = 0, data[0] >> 4
+
+    if ip_start is None:
+        return None
+    if version == 4 and len(data) >= ip_start + 20:
+        return bytes(data[ip_start + 12:ip_start + 16]), bytes(data[ip_start + 16:ip_start + 20])
+    if version == 6 and len(data) >= ip_start + 40:
+        return bytes(data[ip_start + 8:ip_start + 24]), bytes(data[ip_start + 24:ip_start + 40])
+    return None
+
+
+def to_ranges(packet_numbers):
+    """Collapse sorted packet indexes into inclusive [first, last] ranges"""
+    ranges = []
+    for number in packet_numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ranges
+
+
+def _evidence_key(alert):
+    """Bucket key for an alert as packed address bytes: its (sorted) IP pair,
+    just the source IP when the alert has no usable destination, or None when
+    the source is not an IP address"""
+    try:
+        src = ipaddress.ip_address(str(alert.get('src_ip') or "")).packed
+    except ValueError:
+        return None
+    try:
+        dst = ipaddress.ip_address(str(alert.get('dst_ip') or "")).packed
+    except ValueError:
+        return (src,)
+    return (src, dst) if src <= dst else (dst, src)
+
+
+def collect_evidence(reader, index, alerts, window=60, max_packets=1000):
+    """Return the supporting packet ranges for every alert, in alert order.
+
+    A packet supports an alert when it lies within +/- window seconds of the
+    alert timestamp and was sent between the alert's source and destination
+    (in either direction); alerts without a usable destination match any
+    packet to or from the source. Only packets inside the span of the alert
+    windows are parsed, once each: their raw addresses are bucketed by the
+    IP pairs the alerts refer to, and each alert then bisects its bucket by
+    time.
+    """
+    keys = [_evidence_key(alert) for alert in alerts]
+    evidence = [[] for _ in alerts]
+    times = [alert['timestamp'] for alert, key in zip(alerts, keys)
+             if key is not None and alert.get('timestamp') is not None]
+    if not times:
+        return evidence
+
+    pairs = {key: [] for key in keys if key is not None and len(key) == 2}
+    sources = {key[0]: [] for key in keys if key is not None and len(key) == 1}
+
+    # The index is sorted by time, so packets outside every alert window are skipped
+    first = bisect.bisect_left(index.timestamps, min(times) - window)
+    last = bisect.bisect_right(index.timestamps, max(times) + window)
+    offsets = index.offsets
+    for number in range(first, last):
+        _, linktype, data = reader.packet_at(offsets[number])
+        addresses = packet_addresses(linktype, data)
+        if addresses is None:
+            continue
+        src, dst = addresses
+        if pairs:
+            bucket = pairs.get((src, dst) if src <= dst else (dst, src))
+            if bucket is not None:
+                bucket.append(number)
+        if sources:
+            bucket = sources.get(src)
+            if bucket is not None:
+                bucket.append(number)
+            bucket = sources.get(dst) if dst != src else None
+            if bucket is not None:
+                bucket.append(number)
+
+    timestamp_of = index.timestamps.__getitem__
+    for position, (alert, key) in enumerate(zip(alerts, keys)):
+        if key is None or alert.get('timestamp') is None:
+            continue
+        bucket = pairs[key] if len(key) == 2 else sources[key[0]]
+        if not bucket:
+            continue
+        start = bisect.bisect_left(bucket, alert['timestamp'] - window, key=timestamp_of)
+        end = bisect.bisect_right(bucket, alert['timestamp'] + window, key=timestamp_of)
+        evidence[position] = to_ranges(bucket[start:min(end, start + max_packets)])
+
+    return evidence
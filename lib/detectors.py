@@ -0,0 +1,501 @@
+"""
+Detector Pipeline
+-----------------
+Pluggable threat detectors fed by a single-pass dispatcher. Each detector
+declares the record types it consumes ("conn", "dns", ...); the pipeline walks
+every record once and hands it to all interested detectors.
+"""
+
+import importlib
+import logging
+import time
+from collections import OrderedDict
+
+from lib.sketches import BloomFilter, CountMinSketch, HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+# Registered detector classes, keyed by the name used in config.yaml
+DETECTORS = {}
+
+# Common public suffixes of more than one label, under which the registered
+# domain has three labels (example.co.uk) instead of two (example.com)
+MULTI_LABEL_SUFFIXES = (
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "com.au", "net.au", "org.au",
+    "co.nz", "co.jp", "ne.jp", "or.jp", "co.kr", "co.in", "co.za",
+    "com.br", "com.cn", "com.mx", "com.tr", "com.sg", "com.hk",
+)
+
+
+def register_detector(cls):
+    """Class decorator that makes a detector available to the pipeline config"""
+    DETECTORS[cls.name] = cls
+    return cls
+
+
+class Detector:
+    """Base class for pipeline detectors.
+
+    Subclasses set ``name``, ``record_types`` and, optionally,
+    ``config_section`` (the ``detection.<section>`` block their parameters
+    are read from), then implement process() and, if they keep state that
+    only resolves at the end of the capture, finish().
+
+    When ``detection.approximate.enabled`` is set, detectors that keep
+    per-key counters switch to the fixed-memory sketches in lib.sketches.
+    """
+
+    name = None
+    record_types = ()
+    config_section = None
+
+    def __init__(self, params):
+        self.params = params
+        self.max_state = params.get('max_state', 100000)
+        self.approximate = params.get('approximate') or {}
+        self.approximate_mode = bool(self.approximate.get('enabled'))
+        self.evictions = 0
+
+    def process(self, record_type, record):
+        """Inspect one record and return a list of alerts (possibly empty)"""
+        raise NotImplementedError
+
+    def finish(self):
+        """Return any alerts that can only be raised once all records are seen"""
+        return []
+
+    def state_size(self):
+        """Number of entries currently held in this detector's state"""
+        return 0
+
+    def _trim(self, state):
+        """Evict the least recently seen entries of an OrderedDict state above max_state.
+
+        Detectors call state.move_to_end(key) on every hit, so active sources
+        stay in the state while idle ones are evicted first.
+        """
+        while len(state) > self.max_state:
+            state.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _alert(record, alert_type, severity, details, dst_ip=None):
+        return {
+            'timestamp': float(record.get('timestamp', 0)),
+            'alert_type': alert_type,
+            'src_ip': record.get('src_ip', ''),
+            'dst_ip': dst_ip if dst_ip is not None else record.get('dst_ip', ''),
+            'severity': severity,
+            'details': details
+        }
+
+
+@register_detector
+class PortScanDetector(Detector):
+    """Flags a source that touches many ports on one host within a time window.
+
+    Approximate mode de-duplicates (src, dst, port) triples with a Bloom
+    filter and counts distinct ports per (src, dst) in a count-min sketch,
+    both reset every time_window seconds (tumbling rather than per-pair
+    windows). Memory is fixed at bloom_bits / 8 + cms_width * cms_depth * 4
+    bytes however many flows the capture holds.
+    """
+
+    name = "port_scan"
+    record_types = ("conn",)
+    config_section = "port_scan"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.threshold = params.get('threshold', 10)
+        self.time_window = params.get('time_window', 60)
+        self.severity = params.get('severity', 7)
+        # (src_ip, dst_ip) -> [window_start, set of ports, alerted]
+        self.state = OrderedDict()
+
+        if self.approximate_mode:
+            self.seen = BloomFilter(self.approximate.get('bloom_bits', 8388608),
+                                    self.approximate.get('bloom_hashes', 4))
+            self.port_counts = CountMinSketch(self.approximate.get('cms_width', 65536),
+                                              self.approximate.get('cms_depth', 4))
+            self.window_start = None
+            self.alerted = set()
+
+    def process(self, record_type, record):
+        dst_port = record.get('dst_port')
+        if dst_port in (None, ''):
+            return []
+        if self.approximate_mode:
+            return self._process_approximate(record, dst_port)
+
+        timestamp = float(record.get('timestamp', 0))
+        key = (record.get('src_ip'), record.get('dst_ip'))
+        entry = self.state.get(key)
+
+        if entry is None or timestamp - entry[0] > self.time_window:
+            entry = [timestamp, set(), False]
+            self.state[key] = entry
+            self._trim(self.state)
+        else:
+            self.state.move_to_end(key)
+
+        entry[1].add(dst_port)
+        if not entry[2] and len(entry[1]) >= self.threshold:
+            entry[2] = True
+            return [self._alert(
+                record, "port_scan", self.severity,
+                f"Port scan detected: {len(entry[1])} ports probed on {key[1]} "
+                f"within {self.time_window} seconds")]
+        return []
+
+    def _process_approximate(self, record, dst_port):
+        timestamp = float(record.get('timestamp', 0))
+        if self.window_start is None or timestamp - self.window_start > self.time_window:
+            self.window_start = timestamp
+            self.seen.clear()
+            self.port_counts.clear()
+            self.alerted.clear()
+
+        key = (record.get('src_ip'), record.get('dst_ip'))
+        if self.seen.add((key, dst_port)):
+            return []
+
+        ports = self.port_counts.add(key)
+        if ports >= self.threshold and key not in self.alerted:
+            self.alerted.add(key)
+            return [self._alert(
+                record, "port_scan", self.severity,
+                f"Port scan detected: ~{ports} ports probed on {key[1]} "
+                f"within {self.time_window} seconds (approximate)")]
+        return []
+
+    def state_size(self):
+        if self.approximate_mode:
+            return len(self.alerted)
+        return len(self.state)
+
+
+@register_detector
+class DNSLongQueryDetector(Detector):
+    """Flags unusually long DNS names, a common sign of DNS tunneling"""
+
+    name = "dns_long_query"
+    record_types = ("dns",)
+    config_section = "dns"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.max_query_length = params.get('max_query_length', 50)
+        self.severity = params.get('severity', 6)
+
+    def process(self, record_type, record):
+        query = record.get('query') or ''
+        if len(query) <= self.max_query_length:
+            return []
+        return [self._alert(
+            record, "dns_tunneling", self.severity,
+            f"Long DNS query ({len(query)} chars): {query}")]
+
+
+@register_detector
+class DNSQueryRateDetector(Detector):
+    """Flags sources sending more DNS queries per minute than the threshold.
+
+    Approximate mode counts queries per source in a count-min sketch that is
+    reset every time_window seconds, using cms_width * cms_depth * 4 bytes.
+    """
+
+    name = "dns_query_rate"
+    record_types = ("dns",)
+    config_section = "dns"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.threshold = params.get('query_rate_threshold', 30)
+        self.time_window = params.get('time_window', 60)
+        self.severity = params.get('rate_severity', 5)
+        # src_ip -> [window_start, query count, alerted]
+        self.state = OrderedDict()
+
+        if self.approximate_mode:
+            self.query_counts = CountMinSketch(self.approximate.get('cms_width', 65536),
+                                               self.approximate.get('cms_depth', 4))
+            self.window_start = None
+            self.alerted = set()
+
+    def process(self, record_type, record):
+        timestamp = float(record.get('timestamp', 0))
+        src_ip = record.get('src_ip')
+        if self.approximate_mode:
+            return self._process_approximate(record, timestamp, src_ip)
+
+        entry = self.state.get(src_ip)
+
+        if entry is None or timestamp - entry[0] > self.time_window:
+            entry = [timestamp, 0, False]
+            self.state[src_ip] = entry
+            self._trim(self.state)
+        else:
+            self.state.move_to_end(src_ip)
+
+        entry[1] += 1
+        if not entry[2] and entry[1] > self.threshold:
+            entry[2] = True
+            return [self._alert(
+                record, "dns_high_query_rate", self.severity,
+                f"High DNS query rate: {entry[1]} queries within {self.time_window} seconds")]
+        return []
+
+    def _process_approximate(self, record, timestamp, src_ip):
+        if self.window_start is None or timestamp - self.window_start > self.time_window:
+            self.window_start = timestamp
+            self.query_counts.clear()
+            self.alerted.clear()
+
+        queries = self.query_counts.add(src_ip)
+        if queries > self.threshold and src_ip not in self.alerted:
+            self.alerted.add(src_ip)
+            return [self._alert(
+                record, "dns_high_query_rate", self.severity,
+                f"High DNS query rate: ~{queries} queries within {self.time_window} seconds (approximate)")]
+        return []
+
+    def state_size(self):
+        if self.approximate_mode:
+            return len(self.alerted)
+        return len(self.state)
+
+
+@register_detector
+class DNSUniqueSubdomainDetector(Detector):
+    """Flags a source resolving many distinct subdomains of one domain.
+
+    Subdomains are counted per registered domain: names under one of the
+    multi_label_suffixes (e.g. co.uk) are grouped by their last three labels,
+    everything else by its last two.
+
+    Approximate mode replaces each exact subdomain set with a HyperLogLog of
+    2^hll_precision bytes, so memory is at most max_state * 2^hll_precision
+    bytes.
+    """
+
+    name = "dns_unique_subdomains"
+    record_types = ("dns",)
+    config_section = "dns"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.threshold = params.get('unique_subdomain_threshold', 100)
+        self.severity = params.get('subdomain_severity', 6)
+        self.suffixes = set(params.get('multi_label_suffixes', MULTI_LABEL_SUFFIXES))
+        self.hll_precision = self.approximate.get('hll_precision', 8)
+        # (src_ip, domain) -> [set of subdomains or HyperLogLog, alerted, unique count]
+        self.state = OrderedDict()
+
+    def _registered_domain_labels(self, labels):
+        """Number of trailing labels that make up the registered domain"""
+        return 3 if '.'.join(labels[-2:]) in self.suffixes else 2
+
+    def process(self, record_type, record):
+        labels = (record.get('query') or '').lower().rstrip('.').split('.')
+        depth = self._registered_domain_labels(labels)
+        if len(labels) <= depth:
+            return []
+
+        domain = '.'.join(labels[-depth:])
+        key = (record.get('src_ip'), domain)
+        entry = self.state.get(key)
+        if entry is None:
+            entry = [HyperLogLog(self.hll_precision) if self.approximate_mode else set(), False, 0]
+            self.state[key] = entry
+            self._trim(self.state)
+        else:
+            self.state.move_to_end(key)
+
+        subdomain = '.'.join(labels[:-depth])
+        if self.approximate_mode:
+            # Only re-estimate the cardinality when a register actually changed
+            if entry[0].add(subdomain):
+                entry[2] = entry[0].count()
+        elif subdomain not in entry[0]:
+            entry[0].add(subdomain)
+            entry[2] = len(entry[0])
+        if entry[1]:
+            return []
+
+        unique = entry[2]
+        if unique >= self.threshold:
+            entry[1] = True
+            return [self._alert(
+                record, "dns_subdomain_enumeration", self.severity,
+                f"{unique} unique subdomains of {domain} queried")]
+        return []
+
+    def state_size(self):
+        return len(self.state)
+
+
+@register_detector
+class SQLInjectionDetector(Detector):
+    """Flags HTTP requests whose URI or body contains SQL injection patterns"""
+
+    name = "http_sql_injection"
+    record_types = ("conn",)
+    config_section = "http"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.patterns = [p.upper() for p in params.get('sql_patterns', [])]
+        self.severity = params.get('sql_severity', 9)
+
+    def process(self, record_type, record):
+        payload = f"{record.get('http_uri') or ''} {record.get('payload') or ''}".upper()
+        if not payload.strip():
+            return []
+        for pattern in self.patterns:
+            if pattern in payload:
+                return [self._alert(
+                    record, "sql_injection", self.severity,
+                    f"SQL injection pattern '{pattern}' in HTTP request")]
+        return []
+
+
+@register_detector
+class SuspiciousUserAgentDetector(Detector):
+    """Flags HTTP requests sent by known scanning tools"""
+
+    name = "http_user_agent"
+    record_types = ("conn",)
+    config_section = "http"
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.user_agents = [ua.lower() for ua in params.get('suspicious_user_agents', [])]
+        self.severity = params.get('user_agent_severity', 6)
+
+    def process(self, record_type, record):
+        user_agent = (record.get('http_user_agent') or '').lower()
+        if not user_agent:
+            return []
+        for suspicious in self.user_agents:
+            if suspicious in user_agent:
+                return [self._alert(
+                    record, "suspicious_user_agent", self.severity,
+                    f"Suspicious user agent: {record.get('http_user_agent')}")]
+        return []
+
+
+def _load_detector_class(name, entry):
+    """Resolve a detector class from the registry or a 'module:Class' path"""
+    class_path = entry.get('class')
+    if not class_path:
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector: {name}")
+        return DETECTORS[name]
+
+    module_name, _, class_name = class_path.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+class DetectorPipeline:
+    """Single-pass dispatcher that feeds records to all interested detectors"""
+
+    def __init__(self, config):
+        """Build the enabled detectors from the detection section of the config"""
+        detection = config.get('detection', {})
+        pipeline = detection.get('pipeline', {})
+        default_max_state = pipeline.get('max_state', 100000)
+        # Time one record in every timing_sample per detector (1 times them all)
+        self.timing_sample = max(1, pipeline.get('timing_sample', 100))
+
+        self.detectors = []
+        for name, entry in (pipeline.get('detectors') or {}).items():
+            entry = entry or {}
+            if not entry.get('enabled', True):
+                continue
+
+            cls = _load_detector_class(name, entry)
+            params = {'max_state': default_max_state,
+                      'approximate': detection.get('approximate') or {}}
+            if cls.config_section:
+                params.update(detection.get(cls.config_section) or {})
+            params.update({k: v for k, v in entry.items() if k not in ('enabled', 'class')})
+            detector = cls(params)
+            detector.name = name
+            self.detectors.append(detector)
+
+        # Record type -> detectors subscribed to it
+        self.subscribers = {}
+        for detector in self.detectors:
+            for record_type in detector.record_types:
+                self.subscribers.setdefault(record_type, []).append(detector)
+
+        self.timings = {detector.name: 0.0 for detector in self.detectors}
+        self.record_counts = {}
+
+    def run(self, records_by_type):
+        """Dispatch every record once and return the combined alert list.
+
+        records_by_type maps a record type to an iterable of records, e.g.
+        {"conn": conn_data, "dns": dns_data}.
+        """
+        alerts = []
+        timings = self.timings
+        perf_counter = time.perf_counter
+        sample = self.timing_sample
+
+        for record_type, records in records_by_type.items():
+            detectors = self.subscribers.get(record_type)
+            if not detectors:
+                continue
+
+            # Timing every call costs more than the cheaper detectors themselves,
+            # so only a sample of records is timed and scaled up afterwards
+            sampled = {detector.name: 0.0 for detector in detectors}
+            count = 0
+            for record in records:
+                if count % sample:
+                    for detector in detectors:
+                        found = detector.process(record_type, record)
+                        if found:
+                            alerts.extend(found)
+                else:
+                    for detector in detectors:
+                        start = perf_counter()
+                        found = detector.process(record_type, record)
+                        sampled[detector.name] += perf_counter() - start
+                        if found:
+                            alerts.extend(found)
+                count += 1
+
+            timed = (count + sample - 1) // sample
+            for name, seconds in sampled.items():
+                if timed:
+                    timings[name] += seconds * count / timed
+            self.record_counts[record_type] = self.record_counts.get(record_type, 0) + count
+
+        for detector in self.detectors:
+            start = perf_counter()
+            alerts.extend(detector.finish())
+            timings[detector.name] += perf_counter() - start
+
+        self.log_stats()
+        return alerts
+
+    def stats(self):
+        """Per-detector timing (estimated from the timed sample) and state figures for the last run"""
+        return {
+            detector.name: {
+                'seconds': round(self.timings[detector.name], 6),
+                'state_size': detector.state_size(),
+                'evictions': detector.evictions
+            }
+            for detector in self.detectors
+        }
+
+    def log_stats(self):
+        for name, stats in self.stats().items():
+            logger.info(
+                f"Detector {name}: {stats['seconds']:.3f}s, "
+                f"state {stats['state_size']} entries, {stats['evictions']} evictions")
@@ -0,0 +1,333 @@
+"""
+Retention Manager
+-----------------
+Applies retention policies to the logs and uploads directories: compacts old
+or oversized scan folders into compressed archives, deletes archives past
+their maximum age or when the total size budget is exceeded, and removes
+uploads that no longer belong to any scan.
+
+Archives are written to <logs>/archive/<scan folder>.tar.gz together with a
+<scan folder>.json sidecar holding the scan metadata, so archived scans can
+still be listed without opening the tarball. The small result files in
+KEPT_FILES are stored uncompressed in <logs>/archive/<scan folder>/ so that
+scan details and alert evidence never need the tarball decompressed.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tarfile
+import time
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".tar.gz"
+MB = 1024 * 1024
+DAY = 86400
+
+# Result files left uncompressed next to the archive rather than inside it
+KEPT_FILES = ("scan_metadata.json", "scan_info.txt", "alerts.csv", "evidence.json", "packet_index.bin")
+
+
+def dir_size(path):
+    """Total size in bytes of all files below path"""
+    return dir_stats(path)[0]
+
+
+def dir_stats(path):
+    """Return (total size in bytes, newest file modification time) of a directory tree"""
+    total = 0
+    newest = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return total, newest
+
+
+def scan_metadata(folder_path):
+    """Return the scan metadata for a scan folder, falling back to its name"""
+    metadata_path = os.path.join(folder_path, "scan_metadata.json")
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as f:
+                return json.load(f)
+        except Exception:
+            pass
+
+    item = os.path.basename(folder_path)
+    return {
+        "scan_id": item.split("_")[1] if len(item.split("_")) > 1 else "unknown",
+        "filename": item,
+        "timestamp": item.split("_")[-1] if "_" in item else "",
+        "scan_folder": folder_path,
+        "status": "unknown"
+    }
+
+
+def archived_file_path(archive_path, filename):
+    """Path of a result file kept uncompressed next to a scan archive, or None"""
+    path = os.path.join(archive_path[:-len(ARCHIVE_SUFFIX)], filename)
+    return path if os.path.exists(path) else None
+
+
+def read_archive_files(archive_path, filenames):
+    """Read result files of an archived scan, returning {filename: bytes}.
+
+    Small result files are read from the uncompressed files kept next to the
+    archive. Anything else is streamed out of the tarball in a single pass
+    that stops as soon as every requested file has been found.
+    """
+    found = {}
+    for filename in filenames:
+        path = archived_file_path(archive_path, filename)
+        if path:
+            with open(path, "rb") as f:
+                found[filename] = f.read()
+
+    missing = set(filenames) - set(found)
+    if not missing:
+        return found
+
+    try:
+        with tarfile.open(archive_path, "r|gz") as archive:
+            for member in archive:
+                name = os.path.basename(member.name)
+                if member.isfile() and name in missing:
+                    found[name] = archive.extractfile(member).read()
+                    missing.discard(name)
+                    if not missing:
+                        break
+    except (OSError, tarfile.TarError) as e:
+        logger.error(f"Error reading {sorted(missing)} from {archive_path}: {e}")
+    return found
+
+
+class RetentionManager:
+    """Applies age and size based retention to scan logs and uploads"""
+
+    def __init__(self, logs_dir, upload_dir, policy):
+        """Initialize with the directories to manage and the retention policy"""
+        self.logs_dir = logs_dir
+        self.upload_dir = upload_dir
+        self.archive_dir = os.path.join(logs_dir, policy.get('archive_dir', 'archive'))
+        self.compact_after = policy.get('compact_after_days', 7) * DAY
+        self.max_age = policy.get('max_age_days', 90) * DAY
+        self.max_total_size = policy.get('max_total_size_mb', 2048) * MB
+        self.max_scan_size = policy.get('max_scan_size_mb', 200) * MB
+        self.orphan_age = policy.get('orphan_upload_hours', 24) * 3600
+        self.grace = policy.get('grace_minutes', 60) * 60
+
+    def _scan_folders(self):
+        """Live scan folders as (path, folder mtime) pairs"""
+        folders = []
+        if not os.path.isdir(self.logs_dir):
+            return folders
+        for item in os.listdir(self.logs_dir):
+            path = os.path.join(self.logs_dir, item)
+            if os.path.isdir(path) and "_" in item and path != self.archive_dir:
+                folders.append((path, os.path.getmtime(path)))
+        return folders
+
+    def _archives(self):
+        """Archived scans as (archive path, sidecar path, mtime) tuples"""
+        archives = []
+        if not os.path.isdir(self.archive_dir):
+            return archives
+        for item in os.listdir(self.archive_dir):
+            if item.endswith(ARCHIVE_SUFFIX):
+                path = os.path.join(self.archive_dir, item)
+                sidecar = path[:-len(ARCHIVE_SUFFIX)] + ".json"
+                archives.append((path, sidecar, os.path.getmtime(path)))
+        return archives
+
+    def list_archived_scans(self):
+        """Metadata of every archived scan, read from the sidecar files"""
+        scans = []
+        for archive_path, sidecar, _ in self._archives():
+            try:
+                with open(sidecar, "r") as f:
+                    scan = json.load(f)
+            except Exception:
+                scan = scan_metadata(archive_path[:-len(ARCHIVE_SUFFIX)])
+            scan["scan_folder"] = archive_path
+            scan["archived"] = True
+            scans.append(scan)
+        return scans
+
+    @staticmethod
+    def is_finished(folder_path):
+        """Whether a scan folder's analysis has completed.
+
+        Backend uploads get scan_metadata.json once the analyzer subprocess
+        exits; CLI runs write scan_info.txt directly into their folder.
+        """
+        return (os.path.exists(os.path.join(folder_path, "scan_metadata.json"))
+                or os.path.exists(os.path.join(folder_path, "scan_info.txt")))
+
+    def compact(self, folder_path, dry_run=False):
+        """Compress a scan folder into the archive directory and remove it"""
+        name = os.path.basename(folder_path)
+        archive_path = os.path.join(self.archive_dir, name + ARCHIVE_SUFFIX)
+        sidecar = os.path.join(self.archive_dir, name + ".json")
+        kept_dir = os.path.join(self.archive_dir, name)
+        if dry_run:
+            return archive_path
+
+        os.makedirs(kept_dir, exist_ok=True)
+        metadata = scan_metadata(folder_path)
+        _, newest = dir_stats(folder_path)
+
+        # Keep the small result files uncompressed; the analyzer may have put
+        # them in its own run folder inside the scan folder
+        kept = set()
+        for root, _, files in os.walk(folder_path):
+            for filename in files:
+                if filename in KEPT_FILES and filename not in kept:
+                    shutil.copy2(os.path.join(root, filename), os.path.join(kept_dir, filename))
+                    kept.add(filename)
+
+        def exclude_kept(member):
+            return None if os.path.basename(member.name) in kept else member
+
+        # Write to a temporary name first so a crash never leaves a half archive
+        tmp_path = archive_path + ".tmp"
+        with tarfile.open(tmp_path, "w:gz") as archive:
+            archive.add(folder_path, arcname=name, filter=exclude_kept)
+        os.replace(tmp_path, archive_path)
+        # Date the archive by the scan's last write so age checks and the
+        # oldest-first size budget see the scan's age, not the compaction time
+        os.utime(archive_path, (newest, newest))
+
+        with open(sidecar, "w") as f:
+            json.dump(metadata, f)
+
+        shutil.rmtree(folder_path)
+        logger.info(f"Compacted scan {name} into {archive_path}")
+        return archive_path
+
+    def _uploads_by_scan(self):
+        """Map each scan ID to the paths of its uploads"""
+        uploads = {}
+        if not os.path.isdir(self.upload_dir):
+            return uploads
+        for item in os.listdir(self.upload_dir):
+            path = os.path.join(self.upload_dir, item)
+            if os.path.isfile(path):
+                # Uploads are saved as <scan_id>_<original filename>
+                uploads.setdefault(item.split("_", 1)[0], []).append(path)
+        return uploads
+
+    def _archive_size(self, archive_path, uploads):
+        """Bytes held by an archived scan: tarball, kept files and its uploads"""
+        size = os.path.getsize(archive_path) + dir_size(archive_path[:-len(ARCHIVE_SUFFIX)])
+        return size + sum(os.path.getsize(path) for path in uploads)
+
+    def _delete_archive(self, archive_path, sidecar, uploads, dry_run=False):
+        """Delete an archived scan together with its uploaded capture"""
+        if dry_run:
+            return
+        for path in [archive_path, sidecar] + uploads:
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(archive_path[:-len(ARCHIVE_SUFFIX)], ignore_errors=True)
+        logger.info(f"Deleted archived scan {archive_path}")
+
+    def _archive_scan_id(self, sidecar):
+        try:
+            with open(sidecar, "r") as f:
+                return json.load(f).get("scan_id")
+        except Exception:
+            return None
+
+    def _known_scan_ids(self):
+        ids = {scan_metadata(path).get("scan_id") for path, _ in self._scan_folders()}
+        ids.update(scan.get("scan_id") for scan in self.list_archived_scans())
+        return ids
+
+    def collect_orphan_uploads(self, dry_run=False, now=None):
+        """Delete uploads older than the orphan age that belong to no scan"""
+        now = now or time.time()
+        removed = []
+        if not os.path.isdir(self.upload_dir):
+            return removed
+
+        known = self._known_scan_ids()
+        for item in os.listdir(self.upload_dir):
+            path = os.path.join(self.upload_dir, item)
+            if not os.path.isfile(path):
+                continue
+            # Uploads are saved as <scan_id>_<original filename>
+            scan_id = item.split("_", 1)[0]
+            if scan_id in known or now - os.path.getmtime(path) < self.orphan_age:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(path)
+            logger.info(f"Removed orphaned upload {path}")
+        return removed
+
+    def run(self, dry_run=False, now=None):
+        """Apply every policy once and return a summary of what was done"""
+        now = now or time.time()
+        summary = {"compacted": [], "deleted": [], "orphans_removed": [], "bytes_freed": 0}
+
+        # 1. Compact finished scans that are old enough or too large to keep
+        #    expanded. Anything touched within the grace period may still be
+        #    written by a running analyzer and is left alone.
+        for path, _ in self._scan_folders():
+            size, newest = dir_stats(path)
+            if not self.is_finished(path) or now - newest < self.grace:
+                continue
+            if now - newest >= self.compact_after or size > self.max_scan_size:
+                try:
+                    archive_path = self.compact(path, dry_run)
+                    if not dry_run:
+                        summary["bytes_freed"] += size - dir_size(archive_path[:-len(ARCHIVE_SUFFIX)]) \
+                            - os.path.getsize(archive_path)
+                    summary["compacted"].append(path)
+                except Exception as e:
+                    logger.error(f"Failed to compact {path}: {e}", exc_info=True)
+
+        # 2. Delete archives (and their uploads) past the maximum age (0 keeps them forever)
+        uploads = self._uploads_by_scan()
+        archives = sorted(self._archives(), key=lambda a: a[2])
+        kept = []
+        deleted_size = 0
+        for archive_path, sidecar, mtime in archives:
+            scan_uploads = uploads.pop(self._archive_scan_id(sidecar), [])
+            if self.max_age and now - mtime >= self.max_age:
+                deleted_size += self._archive_size(archive_path, scan_uploads)
+                self._delete_archive(archive_path, sidecar, scan_uploads, dry_run)
+                summary["deleted"].append(archive_path)
+            else:
+                kept.append((archive_path, sidecar, scan_uploads))
+
+        summary["bytes_freed"] += deleted_size
+
+        # 3. Enforce the total size budget of logs plus uploads, oldest archives first
+        if self.max_total_size:
+            total = dir_size(self.logs_dir) + dir_size(self.upload_dir) - (deleted_size if dry_run else 0)
+            for archive_path, sidecar, scan_uploads in kept:
+                if total <= self.max_total_size:
+                    break
+                size = self._archive_size(archive_path, scan_uploads)
+                self._delete_archive(archive_path, sidecar, scan_uploads, dry_run)
+                summary["deleted"].append(archive_path)
+                summary["bytes_freed"] += size
+                total -= size
+
+        # 4. Garbage-collect uploads whose scans are gone
+        for path in self.collect_orphan_uploads(dry_run, now):
+            summary["orphans_removed"].append(path)
+
+        logger.info(
+            f"Retention run: {len(summary['compacted'])} compacted, {len(summary['deleted'])} deleted, "
+            f"{len(summary['orphans_removed'])} orphaned uploads removed, "
+            f"{summary['bytes_freed'] / MB:.1f} MB freed")
+        return summary
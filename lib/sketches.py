@@ -0,0 +1,147 @@
+"""
+Sketches
+--------
+Fixed-memory probabilistic data structures used by the approximate detection
+mode. Each structure documents its memory use and error bound:
+
+- HyperLogLog: 2^p one-byte registers; cardinality standard error is about
+  1.04 / sqrt(2^p) (p=8: ~6.5%, p=10: ~3.3%, p=12: ~1.6%).
+- CountMinSketch: width * depth 32-bit counters; estimates never undercount
+  and overcount by at most e / width * N with probability 1 - e^-depth,
+  where N is the total of all added counts.
+- BloomFilter: fixed bit array; no false negatives, false positive rate of
+  roughly (1 - e^(-k * n / bits))^k after n insertions with k hashes.
+"""
+
+import array
+import hashlib
+import math
+
+MASK64 = (1 << 64) - 1
+
+
+def _hash128(value):
+    """Return two independent 64-bit hashes of a value"""
+    digest = hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class HyperLogLog:
+    """Cardinality estimator with 2^precision one-byte registers"""
+
+    def __init__(self, precision=10):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        if self.m == 16:
+            self.alpha = 0.673
+        elif self.m == 32:
+            self.alpha = 0.697
+        elif self.m == 64:
+            self.alpha = 0.709
+        else:
+            self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add(self, value):
+        """Add a value; returns True if a register changed (and count() may differ)"""
+        x = _hash128(value)[0]
+        index = x >> (64 - self.precision)
+        remaining = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def count(self):
+        estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        # Small-range correction (linear counting)
+        if estimate <= 2.5 * self.m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        for i, r in enumerate(other.registers):
+            if r > self.registers[i]:
+                self.registers[i] = r
+
+    def __len__(self):
+        return self.count()
+
+
+class CountMinSketch:
+    """Frequency estimator with depth rows of width 32-bit counters"""
+
+    def __init__(self, width=65536, depth=4):
+        if width < 1 or depth < 1:
+            raise ValueError("CountMinSketch width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self.tables = [array.array("I", bytes(4 * width)) for _ in range(depth)]
+        self.total = 0
+
+    def _columns(self, key):
+        h1, h2 = _hash128(key)
+        return [((h1 + i * h2) & MASK64) % self.width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Add count to key and return its new estimate"""
+        estimate = None
+        for table, column in zip(self.tables, self._columns(key)):
+            value = min(table[column] + count, 0xFFFFFFFF)
+            table[column] = value
+            estimate = value if estimate is None else min(estimate, value)
+        self.total += count
+        return estimate
+
+    def estimate(self, key):
+        return min(table[column] for table, column in zip(self.tables, self._columns(key)))
+
+    def clear(self):
+        for table in self.tables:
+            table[:] = array.array("I", bytes(4 * self.width))
+        self.total = 0
+
+    def error_bound(self):
+        """Maximum overcount (with probability 1 - e^-depth) at the current total"""
+        return math.e / self.width * self.total
+
+
+class BloomFilter:
+    """Set membership filter with a fixed number of bits"""
+
+    def __init__(self, bits=8388608, hashes=4):
+        if bits < 8 or hashes < 1:
+            raise ValueError("BloomFilter needs at least 8 bits and one hash")
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def add(self, value):
+        """Add value and return True if it was (probably) already present"""
+        h1, h2 = _hash128(value)
+        present = True
+        for i in range(self.hashes):
+            bit = ((h1 + i * h2) & MASK64) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.array[byte] & mask:
+                present = False
+                self.array[byte] |= mask
+        return present
+
+    def __contains__(self, value):
+        h1, h2 = _hash128(value)
+        for i in range(self.hashes):
+            bit = ((h1 + i * h2) & MASK64) % self.bits
+            if not self.array[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def clear(self):
+        self.array = bytearray(len(self.array))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Log Retention
+-------------
+Applies the retention policies from config.yaml to the logs and uploads
+directories: compacts old scans into archives, deletes expired archives and
+garbage-collects orphaned uploads.
+"""
+
+import argparse
+import logging
+import sys
+
+import yaml
+
+from lib.retention import RetentionManager
+
+def load_config(config_path):
+    """Load configuration from YAML file"""
+    try:
+        with open(config_path, 'r') as file:
+            return yaml.safe_load(file)
+    except Exception as e:
+        logging.error(f"Failed to load configuration: {e}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply retention policies to PCAP analyzer logs")
+    parser.add_argument("--config", default="config/config.yaml",
+                        help="Path to configuration file (default: config/config.yaml)")
+    parser.add_argument("--logs-dir", default="logs",
+                        help="Directory holding the scan folders (default: logs)")
+    parser.add_argument("--uploads-dir", default="uploads",
+                        help="Directory holding uploaded captures (default: uploads)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report what would be compacted or deleted without changing anything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = load_config(args.config)
+    manager = RetentionManager(args.logs_dir, args.uploads_dir, config.get('retention') or {})
+    summary = manager.run(dry_run=args.dry_run)
+
+    prefix = "Would have" if args.dry_run else "Retention complete:"
+    print(f"\n{prefix} compacted {len(summary['compacted'])} scans, "
+          f"deleted {len(summary['deleted'])} archives and "
+          f"removed {len(summary['orphans_removed'])} orphaned uploads")
+    if not args.dry_run:
+        print(f"- Freed {summary['bytes_freed'] / (1024 * 1024):.1f} MB")
+
+if __name__ == "__main__":
+    main()
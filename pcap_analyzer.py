@@ -17,8 +17,10 @@ from pathlib import Path
 # Import local modules
 from lib.pcap_processor import PCAPProcessor
 from lib.threat_detector import ThreatDetector
+from lib.detectors import DetectorPipeline
 from lib.wazuh_integrator import WazuhIntegrator
 from lib.logger import setup_logging
+from lib.capture_index import CaptureReader, collect_evidence
 
 def load_config(config_path):
     """Load configuration from YAML file"""
@@ -47,15 +49,18 @@ def create_scan_folder(pcap_file_path, base_output_dir="logs"):
     
     return folder_path
 
-def save_wazuh_format_alerts(alerts, output_file):
-    """Save alerts in Wazuh format to a local JSON file when Wazuh integration is disabled"""
+def save_wazuh_format_alerts(alerts, output_file, packet_ranges=None):
+    """Save alerts in Wazuh format to a local JSON file when Wazuh integration is disabled.
+
+    packet_ranges, as returned by save_alert_evidence, is added to each alert's data.
+    """
     try:
         if not alerts:
             logging.warning("No alerts to save in Wazuh format")
             return
             
         wazuh_alerts = []
-        for alert in alerts:
+        for alert_index, alert in enumerate(alerts):
             alert_time = datetime.fromtimestamp(alert['timestamp']).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
             
             wazuh_alert = {
@@ -81,6 +86,8 @@ def save_wazuh_format_alerts(alerts, output_file):
                 },
                 "location": "pcap_analyzer"
             }
+            if packet_ranges and packet_ranges[alert_index]:
+                wazuh_alert["data"]["packet_ranges"] = packet_ranges[alert_index]
             wazuh_alerts.append(wazuh_alert)
         
         # Create directory if it doesn't exist
@@ -95,6 +102,49 @@ def save_wazuh_format_alerts(alerts, output_file):
     except Exception as e:
         logging.error(f"Error saving Wazuh format alerts: {e}", exc_info=True)
 
+def save_alert_evidence(pcap_file_path, alerts, scan_folder, evidence_config):
+    """Index the capture and record the packet ranges that support each alert.
+
+    Returns the ranges per alert, in alert order, or None if indexing failed.
+    The alert dicts themselves are left unchanged.
+    """
+    try:
+        window = evidence_config.get('window_seconds', 60)
+        max_packets = evidence_config.get('max_packets', 1000)
+        
+        with CaptureReader(pcap_file_path) as reader:
+            index = reader.build_index()
+            index_path = os.path.join(scan_folder, "packet_index.bin")
+            index.save(index_path)
+            
+            packet_ranges = collect_evidence(reader, index, alerts, window, max_packets)
+            
+            evidence = []
+            for alert_index, alert in enumerate(alerts):
+                evidence.append({
+                    "alert_index": alert_index,
+                    "alert_type": alert['alert_type'],
+                    "src_ip": alert['src_ip'],
+                    "dst_ip": alert['dst_ip'],
+                    "timestamp": alert['timestamp'],
+                    "packet_ranges": packet_ranges[alert_index]
+                })
+        
+        with open(os.path.join(scan_folder, "evidence.json"), "w") as f:
+            json.dump({
+                "pcap_file": str(pcap_file_path),
+                "index_file": "packet_index.bin",
+                "packets": len(index),
+                "alerts": evidence
+            }, f, indent=2)
+        
+        logging.info(f"Indexed {len(index)} packets and recorded evidence for {len(alerts)} alerts")
+        return packet_ranges
+        
+    except Exception as e:
+        logging.error(f"Error recording alert evidence: {e}", exc_info=True)
+        return None
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="PCAP Analyzer with Wazuh Integration")
@@ -145,6 +195,9 @@ def main():
     # Initialize components
     pcap_processor = PCAPProcessor(config)
     threat_detector = ThreatDetector(config)
+    detector_pipeline = None
+    if config['detection'].get('pipeline', {}).get('enabled', False):
+        detector_pipeline = DetectorPipeline(config)
     
     # Initialize Wazuh integrator if enabled
     wazuh_integrator = None
@@ -167,8 +220,16 @@ def main():
         pcap_processor.save_conn_log(conn_data, conn_log_path)
         pcap_processor.save_dns_log(dns_data, dns_log_path)
         
-        # Detect threats
-        alerts = threat_detector.detect_threats(conn_data, dns_data)
+        # Detect threats (single pass through the detector pipeline if configured)
+        if detector_pipeline:
+            alerts = detector_pipeline.run({"conn": conn_data, "dns": dns_data})
+        else:
+            alerts = threat_detector.detect_threats(conn_data, dns_data)
+        
+        # Index packet offsets and link each alert to its supporting packets
+        packet_ranges = None
+        if config.get('evidence', {}).get('enabled', True):
+            packet_ranges = save_alert_evidence(pcap_file_path, alerts, scan_folder, config.get('evidence', {}))
         
         # Save alerts to file
         alerts_log_path = os.path.join(scan_folder, "alerts.csv")
@@ -202,7 +263,7 @@ def main():
                 wazuh_integrator.send_alert(alert)
         else:
             # Save alerts in Wazuh format to local file
-            save_wazuh_format_alerts(alerts, config['wazuh']['local_alerts_file'])
+            save_wazuh_format_alerts(alerts, config['wazuh']['local_alerts_file'], packet_ranges)
         
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+class CachedBody:
+    """A serialized response body with its ETag and lazily built compressed variants"""
+
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.version = version
+        self.etag = f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        self.encoded: Dict[str, bytes] = {}
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """Strong ETag of the representation served with the given content coding"""
+        return f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+    def encode(self, encoding: str) -> bytes:
+        """Return the body compressed with the given encoding, compressing only once"""
+        if encoding not in self.encoded:
+            if encoding == "br":
+                self.encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self.encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self.encoded[encoding]
+
+
+class ResponseCache:
+    """Cache of JSON API responses keyed on route and query parameters.
+
+    Entries are tagged with the version counter at build time; bump() is
+    called whenever scans or alerts are written, which makes every older
+    entry stale. An optional signature callable (e.g. file modification
+    times) catches writes made outside the API, such as CLI analyzer runs.
+    Responses carry an ETag so repeat requests with If-None-Match get a
+    304, and large bodies are served gzip or brotli compressed when the
+    client accepts it. Each content coding gets its own ETag, since the
+    compressed bytes differ from the identity body.
+    """
+
+    def __init__(self, max_entries: int = 256, min_compress_size: int = 1024,
+                 signature: Optional[Callable[[], Any]] = None):
+        self.max_entries = max_entries
+        self.min_compress_size = min_compress_size
+        self.signature = signature
+        self._last_signature = signature() if signature else None
+        self.version = 0
+        self._entries: "OrderedDict[Tuple, CachedBody]" = OrderedDict()
+        self._adapters: Dict[Any, TypeAdapter] = {}
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Invalidate every cached response (called after scans or alerts change)"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def _key(self, request: Request) -> Tuple:
+        return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+    def _serialize(self, data: Any, response_type: Any) -> bytes:
+        adapter = self._adapters.get(response_type)
+        if adapter is None:
+            adapter = self._adapters[response_type] = TypeAdapter(response_type)
+        return adapter.dump_json(adapter.validate_python(data))
+
+    def get(self, request: Request, build: Callable[[], Any], response_type: Any) -> CachedBody:
+        """Return the cached body for this request, building it on a miss"""
+        if self.signature:
+            current = self.signature()
+            if current != self._last_signature:
+                self._last_signature = current
+                self.bump()
+
+        key = self._key(request)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == self.version:
+                self._entries.move_to_end(key)
+                return entry
+            version = self.version
+
+        entry = CachedBody(self._serialize(build(), response_type), version)
+
+        with self._lock:
+            # Don't store a body that was built while the data was being changed
+            if version == self.version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def _choose_encoding(self, request: Request, size: int) -> Optional[str]:
+        if size < self.min_compress_size:
+            return None
+        accepted = [part.split(";")[0].strip() for part in request.headers.get("accept-encoding", "").split(",")]
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def respond(self, request: Request, build: Callable[[], Any], response_type: Any) -> Response:
+        """Serve a request from the cache, with conditional GET and compression"""
+        entry = self.get(request, build, response_type)
+        encoding = self._choose_encoding(request, len(entry.body))
+        etag = entry.etag_for(encoding)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        # If-None-Match uses weak comparison, so W/ tags match their strong form
+        if_none_match = request.headers.get("if-none-match", "")
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(content=entry.encode(encoding), media_type="application/json", headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
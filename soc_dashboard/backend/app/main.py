@@ -1,9 +1,10 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import os
 import sys
 import json
+import asyncio
 from datetime import datetime
 import subprocess
 import shutil
@@ -18,6 +19,7 @@ from services.pcap_service import PCAPService
 from schemas.alerts import Alert, AlertResponse
 from schemas.pcap_upload import PCAPUploadResponse
 from schemas.dashboard import DashboardStats
+from core.response_cache import ResponseCache
 
 app = FastAPI(title="SOC Dashboard API", 
               description="API for the Security Operations Center Dashboard",
@@ -34,6 +36,35 @@ app.add_middleware(
 
 # Initialize services
 pcap_service = PCAPService()
+response_cache = ResponseCache(signature=pcap_service.data_signature)
+
+async def run_retention_periodically(interval: int):
+    """Apply the retention policies to logs and uploads every interval seconds"""
+    while True:
+        try:
+            summary = await asyncio.to_thread(pcap_service.apply_retention)
+            if summary["compacted"] or summary["deleted"]:
+                response_cache.bump()
+        except Exception as e:
+            print(f"Retention run failed: {e}")
+        await asyncio.sleep(interval)
+
+# Reference to the background retention task so it is not garbage-collected
+retention_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_retention_task():
+    """Start the background retention task if it is enabled in config.yaml"""
+    global retention_task
+    policy = pcap_service.retention_policy
+    if policy.get("enabled", False):
+        retention_task = asyncio.create_task(run_retention_periodically(policy.get("interval_seconds", 3600)))
+
+@app.on_event("shutdown")
+async def stop_retention_task():
+    """Cancel the background retention task"""
+    if retention_task is not None:
+        retention_task.cancel()
 
 @app.get("/")
 async def root():
@@ -41,9 +72,9 @@ async def root():
     return {"message": "SOC Dashboard API is running"}
 
 @app.get("/api/stats", response_model=DashboardStats)
-async def get_dashboard_stats():
+async def get_dashboard_stats(request: Request):
     """Get the dashboard stats for quick overview"""
-    return pcap_service.get_dashboard_stats()
+    return response_cache.respond(request, pcap_service.get_dashboard_stats, DashboardStats)
 
 @app.post("/api/upload", response_model=PCAPUploadResponse)
 async def upload_pcap(file: UploadFile = File(...)):
@@ -54,17 +85,21 @@ async def upload_pcap(file: UploadFile = File(...)):
     
     # Process the PCAP
     result = await pcap_service.process_pcap(file)
+    
+    # New scan results and alerts invalidate the cached dashboard responses
+    response_cache.bump()
     return result
 
 @app.get("/api/alerts", response_model=List[AlertResponse])
-async def get_alerts(limit: int = 100, offset: int = 0, alert_type: Optional[str] = None):
+async def get_alerts(request: Request, limit: int = 100, offset: int = 0, alert_type: Optional[str] = None):
     """Get alerts with pagination and optional filtering"""
-    return pcap_service.get_alerts(limit, offset, alert_type)
+    return response_cache.respond(
+        request, lambda: pcap_service.get_alerts(limit, offset, alert_type), List[AlertResponse])
 
 @app.get("/api/scans", response_model=List[dict])
-async def get_scans():
+async def get_scans(request: Request):
     """Get a list of all PCAP analysis scans"""
-    return pcap_service.get_scans()
+    return response_cache.respond(request, pcap_service.get_scans, List[dict])
 
 @app.get("/api/scans/{scan_id}")
 async def get_scan_details(scan_id: str):
@@ -74,6 +109,19 @@ async def get_scan_details(scan_id: str):
         raise HTTPException(status_code=404, detail="Scan not found")
     return scan
 
+@app.get("/api/scans/{scan_id}/alerts/{alert_index}/pcap")
+async def get_alert_evidence(scan_id: str, alert_index: int):
+    """Download the packets that support an alert as a small PCAP file"""
+    # Reading the capture is blocking file I/O, so keep it off the event loop
+    pcap_bytes = await asyncio.to_thread(pcap_service.get_alert_evidence, scan_id, alert_index)
+    if pcap_bytes is None:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    return Response(
+        content=pcap_bytes,
+        media_type="application/vnd.tcpdump.pcap",
+        headers={"Content-Disposition": f'attachment; filename="{scan_id}_alert_{alert_index}.pcap"'}
+    )
+
 @app.get("/api/alerts/{alert_id}")
 async def get_alert_details(alert_id: str):
     """Get detailed information about a specific alert"""
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
 class DashboardStats(BaseModel):
     """Schema for dashboard statistics"""
@@ -7,6 +7,6 @@ class DashboardStats(BaseModel):
     alerts_by_severity: Dict[int, int]
     alerts_by_type: Dict[str, int]
     recent_scans: int
-    top_source_ips: List[Dict[str, str]]
-    top_target_ips: List[Dict[str, str]]
+    top_source_ips: List[Dict[str, Union[str, int]]]
+    top_target_ips: List[Dict[str, Union[str, int]]]
     recent_alerts: List[Dict]
\ No newline at end of file
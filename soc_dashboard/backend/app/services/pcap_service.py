@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import json
@@ -9,6 +10,7 @@ from datetime import datetime
 import csv
 from typing import List, Dict, Optional
 import asyncio
+import yaml
 from collections import Counter
 
 # Add parent directory to path to import the PCAP analyzer modules
@@ -18,6 +20,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 import lib.pcap_processor
 import lib.threat_detector
 from lib.wazuh_integrator import WazuhIntegrator
+from lib.capture_index import CaptureReader, load_offsets
+from lib.retention import RetentionManager, archived_file_path, read_archive_files
 
 
 class PCAPService:
@@ -26,9 +30,15 @@ class PCAPService:
     def __init__(self):
         """Initialize the PCAP service"""
         self.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../'))
-        self.upload_dir = os.path.join(self.base_dir, 'uploads')
-        self.logs_dir = os.path.join(self.base_dir, 'logs')
+        # Uploads, logs and the config can live elsewhere (e.g. a synthetic history for load tests)
+        self.data_dir = os.environ.get("SOC_DATA_DIR", self.base_dir)
+        self.upload_dir = os.path.join(self.data_dir, 'uploads')
+        self.logs_dir = os.path.join(self.data_dir, 'logs')
         self.wazuh_alerts_file = os.path.join(self.logs_dir, 'wazuh_alerts.json')
+        self.config_file = os.environ.get("SOC_CONFIG_FILE", os.path.join(self.base_dir, 'config', 'config.yaml'))
+        config = self._load_config()
+        self.retention_policy = config.get("retention") or {}
+        self.retention = RetentionManager(self.logs_dir, self.upload_dir, self.retention_policy)
         
         # Create necessary directories
         os.makedirs(self.upload_dir, exist_ok=True)
@@ -131,6 +141,15 @@ class PCAPService:
                 "status": f"error: {str(e)}"
             }
 
+    def _load_config(self) -> Dict:
+        """Read the analyzer configuration shared with the backend"""
+        try:
+            with open(self.config_file, "r") as f:
+                return yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f"Error reading configuration: {e}")
+            return {}
+
     def get_alerts(self, limit: int = 100, offset: int = 0, alert_type: Optional[str] = None) -> List[Dict]:
         """Get alerts with pagination and optional filtering"""
         alerts = []
@@ -178,7 +197,7 @@ class PCAPService:
             item_path = os.path.join(self.logs_dir, item)
             
             # Check if it's a directory and looks like a scan folder
-            if os.path.isdir(item_path) and "_" in item:
+            if os.path.isdir(item_path) and "_" in item and item_path != self.retention.archive_dir:
                 # Look for scan metadata
                 metadata_path = os.path.join(item_path, "scan_metadata.json")
                 
@@ -208,6 +227,9 @@ class PCAPService:
                     }
                     scans.append(scan)
         
+        # Include scans that retention has compacted into archives
+        scans.extend(self.retention.list_archived_scans())
+        
         # Sort by timestamp, newest first
         scans.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
         
@@ -218,31 +240,26 @@ class PCAPService:
         # Find the scan folder based on the ID
         for scan in self.get_scans():
             if scan["scan_id"] == scan_id:
-                scan_folder = scan["scan_folder"]
-                
-                # Read all available files in the scan folder
+                # Read all available files in the scan folder (or its archive) in one go
+                contents = self._read_scan_files(scan, ["conn_log.csv", "dns_log.csv", "alerts.csv", "evidence.json"])
                 files = {}
                 
                 # Check for connection log
-                conn_log_path = os.path.join(scan_folder, "conn_log.csv")
-                if os.path.exists(conn_log_path):
-                    with open(conn_log_path, "r") as f:
-                        reader = csv.DictReader(f)
-                        files["connections"] = [row for row in reader][:100]  # Limit to first 100
+                if "conn_log.csv" in contents:
+                    files["connections"] = self._parse_csv(contents["conn_log.csv"], limit=100)  # Limit to first 100
                 
                 # Check for DNS log
-                dns_log_path = os.path.join(scan_folder, "dns_log.csv")
-                if os.path.exists(dns_log_path):
-                    with open(dns_log_path, "r") as f:
-                        reader = csv.DictReader(f)
-                        files["dns_queries"] = [row for row in reader][:100]  # Limit to first 100
+                if "dns_log.csv" in contents:
+                    files["dns_queries"] = self._parse_csv(contents["dns_log.csv"], limit=100)  # Limit to first 100
                 
                 # Check for alerts
-                alerts_path = os.path.join(scan_folder, "alerts.csv")
-                if os.path.exists(alerts_path):
-                    with open(alerts_path, "r") as f:
-                        reader = csv.DictReader(f)
-                        files["alerts"] = [row for row in reader]
+                if "alerts.csv" in contents:
+                    files["alerts"] = self._parse_csv(contents["alerts.csv"])
+                
+                # Check for alert evidence (packet ranges per alert)
+                evidence = self._parse_evidence(scan, contents.get("evidence.json"))
+                if evidence:
+                    files["evidence"] = evidence["alerts"]
                 
                 # Add files to scan data
                 scan["files"] = files
@@ -250,6 +267,97 @@ class PCAPService:
                 
         return None
         
+    def _find_scan_file(self, scan_folder: str, filename: str) -> Optional[str]:
+        """Find a result file in a scan folder or the analyzer's run folder inside it"""
+        path = os.path.join(scan_folder, filename)
+        if os.path.exists(path):
+            return path
+        
+        # The analyzer creates its own <pcap>_<timestamp> folder under --output-dir
+        if os.path.isdir(scan_folder):
+            for item in sorted(os.listdir(scan_folder), reverse=True):
+                path = os.path.join(scan_folder, item, filename)
+                if os.path.exists(path):
+                    return path
+        
+        return None
+        
+    def _scan_file_path(self, scan: Dict, filename: str) -> Optional[str]:
+        """Path of a result file that can be opened directly (not inside an archive)"""
+        if scan.get("archived"):
+            return archived_file_path(scan["scan_folder"], filename)
+        return self._find_scan_file(scan["scan_folder"], filename)
+        
+    def _read_scan_files(self, scan: Dict, filenames: List[str]) -> Dict[str, bytes]:
+        """Read result files from a live scan folder or a compacted archive, keyed by filename"""
+        if scan.get("archived"):
+            return read_archive_files(scan["scan_folder"], filenames)
+        
+        contents = {}
+        for filename in filenames:
+            path = self._find_scan_file(scan["scan_folder"], filename)
+            if path:
+                with open(path, "rb") as f:
+                    contents[filename] = f.read()
+        return contents
+        
+    def _parse_csv(self, content: bytes, limit: Optional[int] = None) -> List[Dict]:
+        """Parse a CSV result file of a scan into rows"""
+        reader = csv.DictReader(io.StringIO(content.decode("utf-8", errors="replace")))
+        rows = [row for row in reader]
+        return rows[:limit] if limit else rows
+        
+    def _parse_evidence(self, scan: Dict, content: Optional[bytes]) -> Optional[Dict]:
+        """Parse the evidence.json written by the analyzer, if any"""
+        if content is None:
+            return None
+        
+        try:
+            return json.loads(content)
+        except Exception as e:
+            print(f"Error reading evidence for {scan['scan_folder']}: {e}")
+            return None
+        
+    def get_alert_evidence(self, scan_id: str, alert_index: int) -> Optional[bytes]:
+        """Cut the packets supporting an alert out of the original capture as a PCAP"""
+        for scan in self.get_scans():
+            if scan["scan_id"] != scan_id:
+                continue
+            
+            evidence = self._parse_evidence(scan, self._read_scan_files(scan, ["evidence.json"]).get("evidence.json"))
+            if not evidence or not 0 <= alert_index < len(evidence["alerts"]):
+                return None
+            
+            # The upload may have been garbage-collected by retention
+            pcap_file = evidence["pcap_file"]
+            index_path = self._scan_file_path(scan, evidence["index_file"])
+            if not os.path.exists(pcap_file) or index_path is None:
+                return None
+            
+            # Only the index entries and packets in range are read, not the whole capture
+            linktype, offsets = load_offsets(index_path, evidence["alerts"][alert_index]["packet_ranges"])
+            buffer = io.BytesIO()
+            with CaptureReader(pcap_file) as reader:
+                reader.write_pcap(offsets, linktype, buffer)
+            return buffer.getvalue()
+        
+        return None
+        
+    def data_signature(self) -> tuple:
+        """Cheap fingerprint of the alerts file and scan folders, for cache invalidation"""
+        signature = []
+        for path in (self.wazuh_alerts_file, self.logs_dir, self.retention.archive_dir):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+        
+    def apply_retention(self, dry_run: bool = False) -> Dict:
+        """Run the configured retention policies over logs and uploads"""
+        return self.retention.run(dry_run=dry_run)
+        
     def get_alert_by_id(self, alert_id: str) -> Optional[Dict]:
         """Get an alert by its ID"""
         # Since we generate UUIDs on the fly, this function is not actually useful
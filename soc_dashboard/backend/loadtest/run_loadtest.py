@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+SOC Dashboard Load Test
+-----------------------
+Starts the FastAPI backend under uvicorn against a synthetic alert/scan
+history, drives a mixed workload of dashboard reads and PCAP uploads, and
+reports latency percentiles, throughput and error rates per endpoint.
+Results are saved as JSON so runs can be compared over time.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import yaml
+
+try:
+    import httpx
+except ImportError:
+    print("The load test needs httpx: pip install httpx")
+    sys.exit(1)
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PROJECT_DIR = os.path.abspath(os.path.join(BACKEND_DIR, '../..'))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+ALERT_TYPES = ["port_scan", "dns_tunneling", "dns_high_query_rate", "sql_injection", "suspicious_user_agent"]
+
+
+def random_ip(rng, prefix="10.0"):
+    return f"{prefix}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+def generate_history(data_dir, scans, alerts, seed=42):
+    """Write a synthetic scan history and Wazuh alerts file under data_dir"""
+    rng = random.Random(seed)
+    logs_dir = os.path.join(data_dir, "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    os.makedirs(os.path.join(data_dir, "uploads"), exist_ok=True)
+
+    # Config is read relative to the working directory by the analyzer subprocess
+    # and through SOC_CONFIG_FILE by the backend. Uploads must not forward to
+    # Wazuh or append to the synthetic alert history, so their Wazuh-format
+    # alerts go to a separate file, and retention must not run mid-measurement.
+    with open(os.path.join(PROJECT_DIR, "config", "config.yaml"), "r") as f:
+        config = yaml.safe_load(f)
+    config.setdefault("wazuh", {})
+    config["wazuh"]["enabled"] = False
+    config["wazuh"]["local_alerts_file"] = "logs/upload_alerts.json"
+    config.setdefault("retention", {})
+    config["retention"]["enabled"] = False
+    os.makedirs(os.path.join(data_dir, "config"), exist_ok=True)
+    with open(os.path.join(data_dir, "config", "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    start = datetime.now() - timedelta(days=30)
+    scan_ids = []
+    for i in range(scans):
+        scan_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        timestamp = (start + timedelta(minutes=i * 10)).strftime("%Y%m%d_%H%M%S")
+        scan_folder = os.path.join(logs_dir, f"capture{i}_{timestamp}")
+        os.makedirs(scan_folder, exist_ok=True)
+
+        with open(os.path.join(scan_folder, "conn_log.csv"), "w") as f:
+            f.write("timestamp,src_ip,dst_ip,src_port,dst_port,protocol\n")
+            for _ in range(200):
+                f.write(f"{time.time():.6f},{random_ip(rng)},{random_ip(rng, '172.16')},"
+                        f"{rng.randrange(1024, 65536)},{rng.choice((53, 80, 443))},TCP\n")
+        with open(os.path.join(scan_folder, "alerts.csv"), "w") as f:
+            f.write("timestamp,alert_type,src_ip,dst_ip,severity,details\n")
+            for _ in range(10):
+                f.write(f"{time.time():.6f},{rng.choice(ALERT_TYPES)},{random_ip(rng)},"
+                        f"{random_ip(rng, '172.16')},{rng.randrange(1, 11)},synthetic\n")
+        with open(os.path.join(scan_folder, "scan_metadata.json"), "w") as f:
+            json.dump({
+                "scan_id": scan_id,
+                "filename": f"capture{i}.pcap",
+                "timestamp": timestamp,
+                "connections": 200,
+                "dns_queries": 0,
+                "alerts": 10,
+                "scan_folder": scan_folder,
+                "status": "completed"
+            }, f)
+        scan_ids.append(scan_id)
+
+    wazuh_alerts = []
+    for i in range(alerts):
+        severity = rng.randrange(1, 11)
+        wazuh_alerts.append({
+            "timestamp": (start + timedelta(seconds=i * 5)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            "rule": {"level": severity, "description": "Synthetic load test alert",
+                     "id": f"100{severity}", "pcap_analyzer": True},
+            "agent": {"name": "pcap_analyzer", "id": "000"},
+            "manager": {"name": "pcap_analyzer"},
+            "data": {"alert_type": rng.choice(ALERT_TYPES), "src_ip": random_ip(rng),
+                     "dst_ip": random_ip(rng, "172.16"), "severity": severity},
+            "location": "pcap_analyzer"
+        })
+    with open(os.path.join(logs_dir, "wazuh_alerts.json"), "w") as f:
+        json.dump(wazuh_alerts, f)
+
+    return scan_ids
+
+def generate_capture(packets, rng):
+    """Build a small classic PCAP of TCP SYN packets in memory"""
+    data = [struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)]
+    now = int(time.time())
+    src = bytes([10, 0, rng.randrange(256), rng.randrange(1, 255)])
+    dst = bytes([172, 16, rng.randrange(256), rng.randrange(1, 255)])
+    for i in range(packets):
+        ethernet = b"\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb\x08\x00"
+        ip = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 40, i & 0xFFFF, 0, 64, 6, 0, src, dst)
+        tcp = struct.pack(">HHIIBBHHH", rng.randrange(1024, 65536), rng.randrange(1, 1024),
+                          rng.getrandbits(32), 0, 0x50, 0x02, 1024, 0, 0)
+        frame = ethernet + ip + tcp
+        data.append(struct.pack("<IIII", now + i // 1000, (i % 1000) * 1000, len(frame), len(frame)))
+        data.append(frame)
+    return b"".join(data)
+
+def fetch_scan_ids(base_url):
+    """Scan IDs known to an already running backend"""
+    response = httpx.get(f"{base_url}/api/scans", timeout=60)
+    response.raise_for_status()
+    return [scan["scan_id"] for scan in response.json()]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(data_dir, port, workers):
+    """Start uvicorn serving the backend against data_dir"""
+    env = dict(os.environ, SOC_DATA_DIR=data_dir,
+               SOC_CONFIG_FILE=os.path.join(data_dir, "config", "config.yaml"))
+    cmd = [sys.executable, "-m", "uvicorn", "main:app",
+           "--app-dir", os.path.join(BACKEND_DIR, "app"),
+           "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=data_dir, env=env)
+
+async def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend did not start within {timeout} seconds")
+
+class Recorder:
+    """Collects latency samples and errors per endpoint"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        results = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            errors = self.errors.get(endpoint, 0)
+            results[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "throughput_rps": round(len(samples) / duration, 2),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+                "max_ms": round(samples[-1] * 1000, 2)
+            }
+        return results
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_samples))))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+async def timed_request(client, recorder, endpoint, method, url, check=None, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400 and (check is None or check(response))
+    except (httpx.HTTPError, ValueError):
+        response, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    return response
+
+async def reader(client, recorder, scan_ids, deadline, rng, conditional):
+    """Simulate an analyst's dashboard tab polling the read endpoints"""
+    etags = {}
+    while time.monotonic() < deadline:
+        choice = rng.random()
+        if choice < 0.35:
+            endpoint, url = "GET /api/stats", "/api/stats"
+        elif choice < 0.75:
+            endpoint = "GET /api/alerts"
+            url = f"/api/alerts?limit=100&offset={rng.randrange(0, 1000, 100)}"
+        elif choice < 0.9 or not scan_ids:
+            endpoint, url = "GET /api/scans", "/api/scans"
+        else:
+            endpoint, url = "GET /api/scans/{scan_id}", f"/api/scans/{rng.choice(scan_ids)}"
+
+        headers = {"If-None-Match": etags[url]} if conditional and url in etags else {}
+        response = await timed_request(client, recorder, endpoint, "GET", url, headers=headers)
+        if response is not None and "etag" in response.headers:
+            etags[url] = response.headers["etag"]
+
+async def uploader(client, recorder, deadline, rng, packets, interval):
+    """Upload generated captures, pausing between uploads"""
+    while time.monotonic() < deadline:
+        capture = generate_capture(packets, rng)
+        files = {"file": (f"loadtest_{uuid.uuid4().hex[:8]}.pcap", capture, "application/vnd.tcpdump.pcap")}
+        # An upload only counts as successful if the analysis itself completed
+        await timed_request(client, recorder, "POST /api/upload", "POST", "/api/upload", files=files,
+                            check=lambda response: response.json().get("status") == "completed")
+        await asyncio.sleep(interval)
+
+async def run_workload(base_url, args, scan_ids):
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.readers + args.uploaders)
+    timeout = httpx.Timeout(args.request_timeout)
+
+    await wait_until_ready(base_url)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        start = time.monotonic()
+        deadline = start + args.duration
+        tasks = [reader(client, recorder, scan_ids, deadline, random.Random(rng.random()), args.conditional)
+                 for _ in range(args.readers)]
+        tasks += [uploader(client, recorder, deadline, random.Random(rng.random()),
+                           args.capture_packets, args.upload_interval)
+                  for _ in range(args.uploaders)]
+        await asyncio.gather(*tasks)
+        duration = time.monotonic() - start
+
+    return recorder.summary(duration), duration
+
+def print_report(results, previous=None):
+    print(f"\n{'endpoint':<28}{'reqs':>7}{'err%':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, r in results.items():
+        line = (f"{endpoint:<28}{r['requests']:>7}{r['error_rate'] * 100:>7.1f}{r['throughput_rps']:>9.1f}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+        if previous and endpoint in previous:
+            delta = r['p95_ms'] - previous[endpoint]['p95_ms']
+            line += f"   p95 {delta:+.1f} ms vs previous"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SOC dashboard backend")
+    parser.add_argument("--scans", type=int, default=200, help="Synthetic scans in the history (default: 200)")
+    parser.add_argument("--alerts", type=int, default=10000, help="Synthetic alerts in the history (default: 10000)")
+    parser.add_argument("--readers", type=int, default=20, help="Concurrent dashboard readers (default: 20)")
+    parser.add_argument("--uploaders", type=int, default=2, help="Concurrent uploaders (default: 2)")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds (default: 30)")
+    parser.add_argument("--capture-packets", type=int, default=500,
+                        help="Packets per generated capture (default: 500)")
+    parser.add_argument("--upload-interval", type=float, default=1.0,
+                        help="Seconds each uploader waits between uploads (default: 1.0)")
+    parser.add_argument("--conditional", action="store_true",
+                        help="Readers revalidate with If-None-Match like a browser tab")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (default: 1)")
+    parser.add_argument("--request-timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--url", help="Test an already running backend instead of starting one")
+    parser.add_argument("--compare", help="Previous results JSON to compare p95 latencies against")
+    parser.add_argument("--output", help="Results file (default: loadtest/results/<timestamp>.json)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic data")
+    args = parser.parse_args()
+
+    data_dir = None
+    server = None
+    try:
+        base_url = args.url
+        if base_url:
+            # The running backend serves its own history; read scans from it
+            scan_ids = fetch_scan_ids(base_url)
+            print(f"Found {len(scan_ids)} scans on {base_url}")
+        else:
+            data_dir = tempfile.mkdtemp(prefix="soc_loadtest_")
+            print(f"Generating {args.scans} scans and {args.alerts} alerts in {data_dir}")
+            scan_ids = generate_history(data_dir, args.scans, args.alerts, args.seed)
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            server = start_server(data_dir, port, args.workers)
+
+        print(f"Running {args.readers} readers and {args.uploaders} uploaders for {args.duration:.0f}s against {base_url}")
+        results, duration = asyncio.run(run_workload(base_url, args, scan_ids))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)["endpoints"]
+    print_report(results, previous)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+            "duration_seconds": round(duration, 2),
+            "endpoints": results
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+if __name__ == "__main__":
+    main()